@@ -0,0 +1,499 @@
+"""
+Benchmark suite for the framework's hot paths.
+
+Runs the demo models headless at a configurable scale, and times single framework operations in isolation.
+Results are written as JSON, with throughput (agent-steps/s, calls/s, rows/s or frames/s) and peak memory
+per benchmark. Timings are taken without memory tracing; peak memory is measured in a separate, traced pass
+of each benchmark (skip with --memory 0) and covers the python allocations made within the same measured
+section as the timing. Setup (database, environment, populations and initial state) is excluded from the
+measured section and reported separately as setup_seconds. A stored result file can be used as
+baseline; benchmarks whose throughput dropped by more than the tolerance are flagged as regressions and the
+script exits with status 1. A baseline recorded at a different scale is not compared, and the script exits
+with status 2.
+
+Usage examples:
+
+    python benchmarks/benchmark.py --rows 50 --cols 50 --agents 1000 --iterations 100 --output baseline.json
+    python benchmarks/benchmark.py --rows 50 --cols 50 --agents 1000 --iterations 100 --compare baseline.json
+
+Every benchmark runs against an emptied copy of the results database specified in the config-file, placed in a
+temporary directory together with any animation it creates; the directory is removed afterwards, i.e. the
+configured results database and animations directory are left untouched.
+"""
+
+__author__ = "Linnart Felkl"
+__email__ = "LinnartSF@gmail.com"
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import data
+import config
+import framework
+import animation
+
+def warning(msg: str) -> None:
+    """ helper function for printing warning """
+
+    print("WARNING: " + msg)
+
+def setup(args, populations: list, attrs: list, datatypes: list, initialvals: list) -> tuple:
+    """ sets up database manager, environment and populations; populations is a list of (name, size) tuples """
+
+    db = data.Database("sqlite3", config.path_databasefile)
+    db_manager = data.Manager(db)
+
+    env = framework.Environment(args.capacity, args.endless, args.rows, args.cols, db_manager)
+
+    pops = framework.Populations(amount = len(populations), env = env, db_manager = db_manager, attributes = attrs, datatypes = datatypes)
+    for name, size in populations:
+        pops.add_population(name = name, size = size, attributes = attrs, datatypes = datatypes, initialvals = initialvals)
+
+    return db, db_manager, env, pops
+
+def record(args, sim, pops, env_table: bool = True) -> None:
+    """ writes agents, environment and density table every args.record iterations """
+
+    if (sim.Iteration % args.record) == 0:
+        pops.write_agents_to_db(sim.Iteration)
+        if env_table: pops.write_env_to_db(sim.Iteration)
+        pops.write_density_to_db(sim.Iteration)
+
+def start_section(begin: float) -> tuple:
+    """ marks start of the measured section of a benchmark, begin being the start time of its setup; returns start time, traced memory at that point and setup seconds """
+
+    if tracemalloc.is_tracing(): tracemalloc.reset_peak()
+    start = time.perf_counter()
+
+    return start, tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0, start - begin
+
+def end_section(section: tuple) -> tuple:
+    """ marks end of the measured section; returns seconds, peak traced memory allocated within the section in bytes (0 if not traced), and setup seconds """
+
+    seconds = time.perf_counter() - section[0]
+    peak = tracemalloc.get_traced_memory()[1] - section[1] if tracemalloc.is_tracing() else 0
+
+    return seconds, peak, section[2]
+
+# models; each model returns (seconds, peak, amount, unit, agents, setup_seconds), the measured section covering the simulation run after setup
+
+def model_sir(args) -> tuple:
+    """ SIR demo model """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("humans", args.agents)], ["infected","recovered"], ["INTEGER","INTEGER"], [0, 0])
+    pop = pops.get_population("humans")
+    for agent in pop.get_agents(max(1, int(0.05*pop.Size))): agent.set_attr_value("infected", 1)
+
+    sim = framework.Simulation(args.iterations)
+
+    # make sure that environment and agents tables in database are setup at this time, as in the demos
+    pops.write_env_to_db(sim.Iteration)
+    pops.write_agents_to_db(sim.Iteration)
+
+    section = start_section(begin)
+    while sim.run():
+        for agent in pop.get_agents():
+            if agent.get_attr_value("infected") == 1:
+                for neighbour in env.get_neighbourhood(agent):
+                    if neighbour.get_attr_value("infected") == 0 and neighbour.get_attr_value("recovered") == 0:
+                        if random.uniform(0, 1) < 0.07: neighbour.set_attr_value("infected", 1)
+                if random.uniform(0, 1) < 0.03:
+                    agent.set_attr_value("recovered", 1)
+                    agent.set_attr_value("infected", 0)
+        record(args, sim, pops)
+
+    seconds, peak, setup_seconds = end_section(section)
+    db.close()
+    return seconds, peak, args.agents*args.iterations, "agent-steps/s", args.agents, setup_seconds
+
+def model_segregation(args) -> tuple:
+    """ segregation demo model; one agent is evaluated per iteration """
+
+    begin = time.perf_counter()
+
+    half = args.agents // 2
+    db, db_manager, env, pops = setup(args, [("natives", half), ("immigrants", args.agents - half)], ["utility","type"], ["REAL","TEXT"], [100, "native"])
+    for agent in pops.get_population("immigrants").get_agents(): agent.set_attr_value("type", "immigrant")
+    agents = pops.get_agents()
+
+    def utility(agent, ref) -> float:
+        util = 0.0
+        for o in env.get_neighbourhood(ref, "moore", radius = args.radius):
+            util += 10 if o.get_attr_value("type") == agent.get_attr_value("type") else -10
+        return util
+
+    sim = framework.Simulation(args.iterations)
+
+    # make sure that environment and agents tables in database are setup at this time, as in the demos
+    pops.write_env_to_db(sim.Iteration)
+    pops.write_agents_to_db(sim.Iteration)
+
+    section = start_section(begin)
+    while sim.run():
+        agent = random.choice(agents)
+        util_is = utility(agent, agent)
+        agent.increase_attr_value("utility", util_is)
+        for c in env.get_freecells(n = 10):
+            util_new = utility(agent, c)
+            if util_new > util_is:
+                env.relocate(agent, c)
+                agent.increase_attr_value("utility", util_new)
+                break
+        record(args, sim, pops)
+
+    seconds, peak, setup_seconds = end_section(section)
+    db.close()
+    return seconds, peak, args.iterations, "agent-steps/s", args.agents, setup_seconds
+
+def model_wordofmouth(args) -> tuple:
+    """ word of mouth demo model """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("customers", args.agents)], ["purchased"], ["INTEGER"], [0])
+    agents = pops.get_agents()
+    random.choice(agents).set_attr_value("purchased", 1)
+
+    sim = framework.Simulation(args.iterations)
+
+    # make sure that environment and agents tables in database are setup at this time, as in the demos
+    pops.write_env_to_db(sim.Iteration)
+    pops.write_agents_to_db(sim.Iteration)
+
+    section = start_section(begin)
+    while sim.run():
+        random.shuffle(agents)
+        for agent in agents:
+            for neighbour in env.get_neighbourhood(agent, mode = "moore", radius = args.radius):
+                if agent.get_attr_value("purchased") == 1 and neighbour.get_attr_value("purchased") == 0 and random.uniform(0,1) < 0.03: neighbour.set_attr_value("purchased", 1)
+                if agent.get_attr_value("purchased") == 0 and neighbour.get_attr_value("purchased") == 1 and random.uniform(0,1) < 0.03:
+                    agent.set_attr_value("purchased", 1)
+                    break
+        record(args, sim, pops, env_table = False)
+
+    seconds, peak, setup_seconds = end_section(section)
+    db.close()
+    return seconds, peak, args.agents*args.iterations, "agent-steps/s", args.agents, setup_seconds
+
+def model_gol(args) -> tuple:
+    """ game of life demo model; one agent per cell slot, i.e. --agents is not used """
+
+    begin = time.perf_counter()
+
+    size = args.rows*args.cols*args.capacity
+    db, db_manager, env, pops = setup(args, [("units", size)], ["life_t0","life_t1"], ["INTEGER","INTEGER"], [0, 0])
+    agents = pops.get_agents()
+    for agent in random.sample(agents, size // 2): agent.set_attr_value("life_t0", 1)
+
+    sim = framework.Simulation(args.iterations)
+
+    # make sure that environment and agents tables in database are setup at this time, as in the demos
+    pops.write_env_to_db(sim.Iteration)
+    pops.write_agents_to_db(sim.Iteration)
+
+    section = start_section(begin)
+    while sim.run():
+        for agent in agents:
+            alive = 0
+            for neighbour in env.get_neighbourhood(agent, mode = "moore", radius = 1):
+                if neighbour.get_attr_value("life_t0") == 1: alive += 1
+            if agent.get_attr_value("life_t0") == 1:
+                agent.set_attr_value("life_t1", 1 if alive == 2 or alive == 3 else 0)
+            else:
+                agent.set_attr_value("life_t1", 1 if alive == 3 else 0)
+        record(args, sim, pops, env_table = False)
+        for agent in agents: agent.set_attr_value("life_t0", agent.get_attr_value("life_t1"))
+
+    seconds, peak, setup_seconds = end_section(section)
+    db.close()
+    return seconds, peak, size*args.iterations, "agent-steps/s", size, setup_seconds
+
+# micro-benchmarks; each returns (seconds, peak, amount, unit, agents, setup_seconds), the measured section only covering the benchmarked operation
+
+def micro_get_neighbourhood(args) -> tuple:
+    """ Environment.get_neighbourhood for randomly selected agents """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+    population = pops.get_agents()
+    agents = [random.choice(population) for _ in range(args.calls)]
+
+    section = start_section(begin)
+    for agent in agents: env.get_neighbourhood(agent, mode = "moore", radius = args.radius)
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.calls, "calls/s", args.agents, setup_seconds
+
+def micro_get_freecells(args) -> tuple:
+    """ Environment.get_freecells, sampling 10 free cells per call """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+
+    section = start_section(begin)
+    for _ in range(args.calls): env.get_freecells(n = 10)
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.calls, "calls/s", args.agents, setup_seconds
+
+def micro_relocate(args) -> tuple:
+    """ Environment.relocate of randomly selected agents to a free cell """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+    agents = pops.get_agents()
+
+    seconds = 0.0
+    calls = 0
+    section = start_section(begin)
+    for _ in range(args.calls):
+        cells = env.get_freecells(n = 1)
+        if len(cells) == 0:
+            warning("no free cell left for relocate benchmark")
+            break
+        agent = random.choice(agents)
+        start = time.perf_counter()
+        env.relocate(agent, cells[0])
+        seconds += time.perf_counter() - start
+        calls += 1
+    peak, setup_seconds = end_section(section)[1:]
+
+    db.close()
+    return seconds, peak, calls, "calls/s", args.agents, setup_seconds
+
+def micro_add_population(args) -> tuple:
+    """ Populations.add_population, including placement of all agents """
+
+    begin = time.perf_counter()
+
+    db = data.Database("sqlite3", config.path_databasefile)
+    db_manager = data.Manager(db)
+    env = framework.Environment(args.capacity, args.endless, args.rows, args.cols, db_manager)
+    pops = framework.Populations(amount = 1, env = env, db_manager = db_manager, attributes = ["value"], datatypes = ["REAL"])
+
+    section = start_section(begin)
+    pops.add_population(name = "agents", size = args.agents, attributes = ["value"], datatypes = ["REAL"], initialvals = [1], randomness = [["uniform",0.5,1.5]])
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.agents, "agents/s", args.agents, setup_seconds
+
+def micro_write_agents_to_db(args) -> tuple:
+    """ Populations.write_agents_to_db, one call per iteration """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+
+    section = start_section(begin)
+    for simtime in range(args.iterations): pops.write_agents_to_db(simtime)
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.agents*args.iterations, "rows/s", args.agents, setup_seconds
+
+def micro_write_density_to_db(args) -> tuple:
+    """ Populations.write_density_to_db, one call per iteration """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+    pops.write_env_to_db(0)
+    pops.write_agents_to_db(0)
+
+    section = start_section(begin)
+    for simtime in range(args.iterations): pops.write_density_to_db(simtime)
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.rows*args.cols*args.iterations, "rows/s", args.agents, setup_seconds
+
+def micro_get_agentsdf(args) -> tuple:
+    """ Manager.get_agentsdf after recording all iterations """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+    for simtime in range(args.iterations): pops.write_agents_to_db(simtime)
+
+    section = start_section(begin)
+    df = db_manager.get_agentsdf()
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, len(df), "rows/s", args.agents, setup_seconds
+
+def micro_animate_density(args) -> tuple:
+    """ animation.animate_density for all recorded iterations """
+
+    begin = time.perf_counter()
+
+    db, db_manager, env, pops = setup(args, [("agents", args.agents)], ["value"], ["REAL"], [0])
+    pops.write_env_to_db(0)
+    pops.write_agents_to_db(0)
+    for simtime in range(args.iterations): pops.write_density_to_db(simtime)
+    df = db_manager.get_densitydf()
+
+    section = start_section(begin)
+    animation.animate_density(df = df, filename = "benchmark", attr = "value", defaultsize = 50, color = "red", tpf = 0.05)
+    seconds, peak, setup_seconds = end_section(section)
+
+    db.close()
+    return seconds, peak, args.iterations, "frames/s", args.agents, setup_seconds
+
+models = {
+    "sir": model_sir,
+    "segregation": model_segregation,
+    "wordofmouth": model_wordofmouth,
+    "gol": model_gol
+}
+
+micros = {
+    "get_neighbourhood": micro_get_neighbourhood,
+    "get_freecells": micro_get_freecells,
+    "relocate": micro_relocate,
+    "add_population": micro_add_population,
+    "write_agents_to_db": micro_write_agents_to_db,
+    "write_density_to_db": micro_write_density_to_db,
+    "get_agentsdf": micro_get_agentsdf,
+    "animate_density": micro_animate_density
+}
+
+@contextlib.contextmanager
+def sandbox():
+    """ points results database and animations directory of the config-file to a temporary directory while a benchmark runs; the database is an emptied copy of the configured results database """
+
+    paths = config.path_databasefile, config.path_saveanimations
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        dbpath = os.path.join(tmpdir, "simulationresults")
+        shutil.copyfile(config.path_databasefile, dbpath)
+
+        connection = sqlite3.connect(dbpath)
+        for table in ["agents", "environment", "density"]:
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None:
+                connection.execute("DELETE FROM " + table)
+        connection.commit()
+        connection.close()
+
+        config.path_databasefile, config.path_saveanimations = dbpath, tmpdir
+        try:
+            yield
+        finally:
+            config.path_databasefile, config.path_saveanimations = paths
+
+def run_benchmark(name: str, args) -> dict:
+    """ runs a single model or micro-benchmark and returns its result; timed pass is untraced, peak memory is taken from a second, traced pass """
+
+    benchmark = models[name] if name in models else micros[name]
+
+    random.seed(args.seed)
+    with sandbox():
+        seconds, peak, amount, unit, agents, setup_seconds = benchmark(args)
+
+    if args.memory:
+        random.seed(args.seed)
+        tracemalloc.start()
+        with sandbox():
+            peak = benchmark(args)[1]
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "setup_seconds": setup_seconds,
+        "throughput": amount / seconds if seconds > 0 else 0.0,
+        "unit": unit,
+        "agents": agents,
+        "peak_mb": peak / 1e6
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """ returns list of benchmark names whose throughput dropped by more than tolerance compared to baseline; baseline must be recorded at the same scale """
+
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]: continue
+        reference = baseline["benchmarks"][name]["throughput"]
+        change = result["throughput"] / reference - 1.0 if reference > 0 else 0.0
+        result["change"] = change
+        if change < -tolerance: regressions.append(name)
+
+    return regressions
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "benchmark suite for the framework's hot paths")
+    parser.add_argument("--rows", type = int, default = 50)
+    parser.add_argument("--cols", type = int, default = 50)
+    parser.add_argument("--capacity", type = int, default = 1)
+    parser.add_argument("--endless", type = int, default = 1, help = "1 for endless grid, 0 for bounded grid")
+    parser.add_argument("--agents", type = int, default = 1000, help = "agents per benchmark (split evenly for two populations); gol uses one agent per cell slot instead")
+    parser.add_argument("--iterations", type = int, default = 100)
+    parser.add_argument("--record", type = int, default = 1, help = "record results every n iterations")
+    parser.add_argument("--radius", type = int, default = 1)
+    parser.add_argument("--calls", type = int, default = 10000, help = "calls per micro-benchmark")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--memory", type = int, default = 1, help = "1 for measuring peak memory in a second, traced pass, 0 for timing only")
+    parser.add_argument("--only", nargs = "*", default = [], help = "names of benchmarks to run; default runs all")
+    parser.add_argument("--output", default = "", help = "path of JSON result file; default prints to console")
+    parser.add_argument("--compare", default = "", help = "path of JSON baseline file")
+    parser.add_argument("--tolerance", type = float, default = 0.10, help = "relative throughput drop flagged as regression")
+    args = parser.parse_args()
+    args.endless = bool(args.endless)
+
+    names = args.only if len(args.only) > 0 else list(models.keys()) + list(micros.keys())
+    for name in names:
+        if name not in models and name not in micros:
+            warning("unknown benchmark " + name)
+            sys.exit(2)
+
+    results = {
+        "scale": {k: getattr(args, k) for k in ["rows","cols","capacity","endless","agents","iterations","record","radius","calls"]},
+        "benchmarks": {}
+    }
+
+    for name in names:
+        results["benchmarks"][name] = run_benchmark(name, args)
+        result = results["benchmarks"][name]
+        print(name + ": " + str(round(result["throughput"], 1)) + " " + result["unit"] + ", " + str(round(result["peak_mb"], 1)) + " MB peak")
+
+    status = 0
+    if args.compare != "":
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if results["scale"] != baseline["scale"]:
+            warning("baseline was recorded at a different scale; comparison skipped")
+            status = 2
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+            for name in regressions:
+                warning("regression in " + name + ": throughput changed by " + str(round(100*results["benchmarks"][name]["change"], 1)) + "%")
+            if len(regressions) > 0: status = 1
+
+    if args.output != "":
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+    else:
+        print(json.dumps(results, indent = 2))
+
+    sys.exit(status)
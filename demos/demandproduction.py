@@ -25,6 +25,10 @@ if __name__ == "__main__":
     import random
     import animation
 
+    # seed random number generation; the framework draws from the same generator, i.e. runs are reproducible
+    _seed = 1
+    random.seed(_seed)
+
     # setup database manager and connection
     db = data.Database("sqlite3", config.path_databasefile)
     db_manager = data.Manager(db)
@@ -0,0 +1,189 @@
+"""
+This module is used for running replications and parameter sweeps of a simulation model on several cores.
+
+The model is handed over as a callable that builds and runs one simulation. Every run gets its own
+copy of the results database (the sqlite3 file specified in the config-file), so that worker processes
+never share a database connection. Records in the agents, environment and density tables of the copy are
+deleted before the run starts. Finished runs are merged into one experiment database, in which
+the agents, environment and density tables carry an additional run_id column. The runs table maps
+every run_id to its key, replication number, seed and parameter values.
+
+A run is identified by its key, i.e. its parameter values and replication number, and its seed is derived
+from the master seed and that key. Runs whose key is already contained in the experiment database are skipped,
+i.e. an interrupted experiment is resumed by calling run_experiment again, and the parameter grid or replication
+count can be extended in between. Resuming with a different master seed raises a ValueError. Runs that raise an
+exception are reported with a warning, the remaining runs are still merged, and failed runs are retried on the
+next call.
+
+The model callable must be defined at module level (so that it can be sent to worker processes) and
+has the following signature:
+
+    def model(db_manager: data.Manager, **params) -> None
+
+The random module is seeded for every run before the model callable is invoked.
+"""
+
+__author__ = "Linnart Felkl"
+__email__ = "LinnartSF@gmail.com"
+
+import os
+import json
+import random
+import shutil
+import sqlite3
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import data
+import config
+
+_tables = ["agents", "environment", "density"]
+
+def warning(msg: str) -> None:
+    """ helper function for printing warning """
+
+    print("WARNING: " + msg)
+
+def get_runs(params: dict, replications: int = 1, seed: int = 0) -> list:
+    """ returns list of runs (key, replication, seed, params) for all parameter combinations and replications; seeds are derived from master seed and run key """
+
+    names = list(params.keys())
+    combinations = list(itertools.product(*[params[name] for name in names]))
+
+    runs = []
+    for combination in combinations:
+        runparams = dict(zip(names, combination))
+        for replication in range(replications):
+            key = json.dumps([runparams, replication], sort_keys = True)
+            runs.append((key, replication, random.Random(str(seed) + key).getrandbits(32), runparams))
+
+    return runs
+
+def _execute_run(model, run_id: int, run_seed: int, params: dict, dbpath: str) -> tuple:
+    """ executes a single run in a worker process, writing results into a separate copy of the results database """
+
+    rundbpath = dbpath + "_run" + str(run_id)
+    shutil.copyfile(config.path_databasefile, rundbpath)
+
+    # old results contained in the copied database must not be merged with the results of this run
+    connection = sqlite3.connect(rundbpath)
+    for table in _tables:
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None:
+            connection.execute("DELETE FROM " + table)
+    connection.commit()
+    connection.close()
+
+    random.seed(run_seed)
+
+    db = data.Database("sqlite3", rundbpath)
+    db_manager = data.Manager(db)
+    try:
+        model(db_manager, **params)
+    except Exception:
+        db.close()
+        raise
+    db.commit_n_close()
+
+    return run_id, rundbpath
+
+def _remove_rundb(rundbpath: str) -> None:
+    """ removes run database and its journal file, if existing; failure to remove is reported as warning """
+
+    for path in [rundbpath, rundbpath + "-journal"]:
+        try:
+            if os.path.exists(path): os.remove(path)
+        except OSError as e:
+            warning("could not remove " + path + ": " + repr(e))
+
+def _quote(name: str) -> str:
+    """ returns column name quoted for use in sqlite3 queries """
+
+    return "\"" + name.replace("\"", "\"\"") + "\""
+
+def _merge_run(connection: sqlite3.Connection, run_id: int, run: tuple, rundbpath: str) -> None:
+    """ copies agents, environment and density table of a single run into the experiment database, and registers the run """
+
+    key, replication, run_seed, params = run
+
+    connection.execute("ATTACH DATABASE ? AS run", (rundbpath,))
+    try:
+        for table in _tables:
+            columns = [(row[1], row[2]) for row in connection.execute("PRAGMA run.table_info(" + table + ")")]
+            if len(columns) == 0: continue # table does not exist in run database
+            connection.execute("CREATE TABLE IF NOT EXISTS main." + table + " (run_id INTEGER)")
+            existing = set(row[1] for row in connection.execute("PRAGMA main.table_info(" + table + ")"))
+
+            # columns are matched by name; columns not known yet are added, columns missing in this run remain NULL
+            for name, coltype in columns:
+                if name not in existing: connection.execute("ALTER TABLE main." + table + " ADD COLUMN " + _quote(name) + " " + coltype)
+
+            names = ", ".join(_quote(name) for name, coltype in columns)
+            connection.execute("INSERT INTO main." + table + " (run_id, " + names + ") SELECT ?, " + names + " FROM run." + table, (run_id,))
+
+        connection.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)", (run_id, key, replication, run_seed, json.dumps(params)))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.execute("DETACH DATABASE run")
+
+    _remove_rundb(rundbpath)
+
+def run_experiment(model, params: dict, replications: int = 1, seed: int = 0, workers: int = 0, dbpath: str = "") -> None:
+    """ runs model for every parameter combination and replication in a process pool, merging all results into the experiment database; workers defaults to cpu count, dbpath defaults to results database path with suffix _experiment """
+
+    if replications < 1:
+        warning("replications must be at least 1")
+        return
+
+    if not os.path.isfile(config.path_databasefile):
+        raise FileNotFoundError("results database " + config.path_databasefile + " does not exist; it is copied for every run and must be specified in the config-file")
+
+    if dbpath == "":
+        dbpath = config.path_databasefile + "_experiment"
+
+    connection = sqlite3.connect(dbpath)
+    connection.execute("CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, key TEXT UNIQUE, replication INTEGER, seed INTEGER, params TEXT)")
+    done = dict(connection.execute("SELECT key, seed FROM runs").fetchall())
+    next_id = connection.execute("SELECT COALESCE(MAX(run_id), -1) + 1 FROM runs").fetchone()[0]
+
+    runs = get_runs(params, replications, seed)
+    for key, replication, run_seed, runparams in runs:
+        if key in done and done[key] != run_seed:
+            connection.close()
+            raise ValueError("run " + key + " is stored with a different seed; experiment database was created with another master seed")
+
+    pending = [(next_id + i, run) for i, run in enumerate(run for run in runs if run[0] not in done)]
+
+    print(str(len(runs) - len(pending)) + "/" + str(len(runs)) + " runs completed before, " + str(len(pending)) + " runs to go")
+
+    failed = 0
+    try:
+
+        with ProcessPoolExecutor(max_workers = workers if workers > 0 else None) as executor:
+
+            futures = {executor.submit(_execute_run, model, run_id, run[2], run[3], dbpath): (run_id, run) for run_id, run in pending}
+
+            for i, future in enumerate(as_completed(futures)):
+
+                run_id, run = futures[future]
+                rundbpath = dbpath + "_run" + str(run_id)
+
+                try:
+                    future.result()
+                    _merge_run(connection, run_id, run, rundbpath)
+                except Exception as e:
+                    failed += 1
+                    warning("run " + str(run_id) + " " + run[0] + " failed and will be retried on next call: " + repr(e))
+                    _remove_rundb(rundbpath)
+                    continue
+
+                print("run " + str(run_id) + " done (" + str(i+1) + "/" + str(len(pending)) + ")")
+
+    finally:
+        connection.close()
+
+    if failed > 0:
+        warning(str(failed) + "/" + str(len(pending)) + " runs failed")